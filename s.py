@@ -1,53 +1,232 @@
 import argparse
+from array import array
+import base64
+import bisect
 from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import codecs
+import functools
+import heapq
+import itertools
+import json
+import mmap
 import re
+import shutil
 import subprocess
+import sys
 import os
-from typing import Union
+import threading
+from typing import Callable, Union
+
+try:
+    import charset_normalizer
+except ImportError:
+    charset_normalizer = None
 
 def debug(fmt):
     #print(f"Debug: {fmt}")
     return
 
 QUIET = False
+PIPE_BUFSIZE = 1024 * 1024
+RG = shutil.which("rg")
+GREP = shutil.which("grep") or "grep"
+PARALLEL_MIN_HITS = 64  # below this a worker pool, of processes or threads, costs more than it saves
+MMAP_MIN_SIZE = 1 << 20  # files from this size on are mapped instead of read
+COMBINED_PATTERN_MAX_LEN = 16 << 10  # one argument to grep/rg, the kernel limit is 128 KiB
+
+@functools.lru_cache(maxsize=4096)
+def _compile(pattern: Union[str, re.Pattern]) -> re.Pattern:
+    return re.compile(pattern)
+
+@functools.lru_cache(maxsize=256)
+def _is_literal(pattern: Union[str, re.Pattern]) -> bool:
+    """
+    True when the pattern has no regex metacharacter, so plain string operations give the same result.
+    """
+    return isinstance(pattern, str) and re.escape(pattern) == pattern
 
-class Line:
-    last_opened_file_name = None
-    cached_file = None
+# A regex (string or compiled) or a predicate on the line content
+Matcher = Union[str, re.Pattern, Callable[[str], bool]]
 
-    @classmethod
-    def load_file(cls, file_name:str):
+def _searcher(pattern: Matcher) -> Callable[[str], object]:
+    """
+    Content predicate for a Matcher, resolved once before scanning many lines.
+    """
+    if isinstance(pattern, re.Pattern):
+        return pattern.search
+    if callable(pattern):
+        return pattern
+    return _compile(pattern).search
+
+@functools.lru_cache(maxsize=256)
+def _indentation_pattern(indentation: str, suffix: str) -> re.Pattern:
+    # Only a handful of distinct indentations exist per file, compiled once each
+    return re.compile("^" + re.escape(indentation) + suffix)
+
+RED = "\033[0;31m"
+BLUE = "\033[0;34m"
+RESET = "\033[0m"
+
+@functools.lru_cache(maxsize=256)
+def _highlighter(pattern: Union[str, re.Pattern], color: str) -> Callable[[str], str]:
+    """
+    Builds once per pattern and color the function that colors the matches in a content.
+    """
+    if _is_literal(pattern):
+        colored = f"{color}{pattern}{RESET}"
+        return lambda content: content.replace(pattern, colored)
+
+    # Callable replacement for Pattern.sub, no \g<0> template to expand
+    def repl(m: re.Match) -> str:
+        return color + m.group(0) + RESET
+
+    return functools.partial(_compile(pattern).sub, repl)
+
+# utf-32 BOMs must be tested before utf-16 ones, they share a prefix
+_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+def _bom_encoding(head: bytes) -> str:
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    return None
+
+def _decode(data: bytes) -> str:
+    """
+    Decodes the raw content of a source file with a single full decode.
 
-        if file_name == cls.last_opened_file_name:
-            return cls.cached_file
+    A BOM selects the codec directly, otherwise utf-8 is tried and the
+    encoding of non utf-8 files is guessed from a sample of their content.
+    """
+    encoding = _bom_encoding(data[:4])
+    if encoding:
+        return data.decode(encoding)
 
-        encodings = ['utf-8', 'iso-8859-1', 'utf-16', 'utf-16-le', 'utf-16-be',
-                     'utf-32', 'utf-32-le', 'utf-32-be']
-    
-        for encoding in encodings:
+    if data.isascii():
+        return data.decode('ascii')
+
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
+
+    if charset_normalizer:
+        guess = charset_normalizer.from_bytes(data[:65536]).best()
+        if guess:
             try:
-                with open(file_name, 'r', encoding=encoding) as f:
-                    cls.last_opened_file_name = file_name
-                    cls.cached_file = f.readlines()
-                    return cls.cached_file
+                return data.decode(guess.encoding)
             except UnicodeDecodeError:
-                continue
-            except IOError as e:
-                raise
-    
-        # If none of the encodings worked
-        raise UnicodeDecodeError(
-            'Unknown', b'', 0, 1,
-            f'Failed to decode {file_name} with any of these encodings: '
-            f'{encodings}'
-        )
+                pass
+
+    # iso-8859-1 maps every byte, it never fails
+    return data.decode('iso-8859-1')
+
+class MappedLines:
+    """
+    Read-only sequence over the lines of a memory mapped file.
+
+    Line offsets are found on first access and each line is decoded only
+    when it is read, so a cursor walking a few lines of a large file never
+    decodes the rest of it. Only for byte oriented encodings (utf-8 or
+    8-bit): lines that aren't valid utf-8 are decoded as iso-8859-1.
+    """
+
+    _NEWLINE_RE = re.compile(b'\n')
+
+    def __init__(self, mm: mmap.mmap, start: int = 0):
+        self._mm = mm
+        self._start = start
+        self._offsets = None
+
+    def _get_offsets(self) -> array:
+        if self._offsets is None:
+            mm = self._mm
+            # Unsigned 64-bit array: 8 bytes per line instead of an int object each
+            offsets = array('Q', [self._start])
+            offsets.extend(m.end() for m in self._NEWLINE_RE.finditer(mm, self._start))
+            if offsets[-1] == len(mm):
+                offsets.pop()
+            self._offsets = offsets
+        return self._offsets
+
+    def __len__(self) -> int:
+        return len(self._get_offsets())
+
+    def __getitem__(self, index: int) -> str:
+        offsets = self._get_offsets()
+        end = offsets[index + 1] if index + 1 < len(offsets) else len(self._mm)
+        raw = self._mm[offsets[index]:end]
+        try:
+            return raw.decode('utf-8').rstrip()
+        except UnicodeDecodeError:
+            return raw.decode('iso-8859-1').rstrip()
+
+class Line:
+    __slots__ = ('file_name', 'index', 'content', 'highlight', 'highlight2', 'key', '_indent')
+
+    _file_cache: OrderedDict = OrderedDict()  # file_name -> rstripped lines (tuple or MappedLines)
+    _CACHE_MAX = 64
+    _cache_lock = threading.Lock()  # files are read outside the lock, only the LRU updates are guarded
+
+    @classmethod
+    def load_file(cls, file_name:str) -> Union[tuple[str, ...], MappedLines]:
+
+        with cls._cache_lock:
+            lines = cls._file_cache.get(file_name)
+            if lines is not None:
+                cls._file_cache.move_to_end(file_name)
+                return lines
+
+        lines = cls._read(file_name)
+
+        with cls._cache_lock:
+            cls._file_cache[file_name] = lines
+            if len(cls._file_cache) > cls._CACHE_MAX:
+                cls._file_cache.popitem(last=False)
+        return lines
+
+    @classmethod
+    def _read(cls, file_name: str) -> Union[tuple[str, ...], MappedLines]:
+        with open(file_name, 'rb') as f:
+            if os.fstat(f.fileno()).st_size >= MMAP_MIN_SIZE:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                encoding = _bom_encoding(mm[:4])
+                if encoding in (None, 'utf-8-sig'):
+                    return MappedLines(mm, len(codecs.BOM_UTF8) if encoding else 0)
+
+                # Newlines aren't single bytes in utf-16/32, decode the whole mapping once
+                lines = cls._split(_decode(mm[:]))
+                mm.close()
+                return lines
+
+            return cls._split(_decode(f.read()))
+
+    @staticmethod
+    def _split(text: str) -> tuple[str, ...]:
+        # Split on '\n' only so indexes stay in sync with grep's line numbers
+        lines = text.split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        return tuple(l.rstrip() for l in lines)
 
     def __init__(self, file_name:str, index:int, content:str, highlight=None):
+        # Interned, so keys of one file share the name and compare it by identity
+        file_name = sys.intern(file_name)
         self.file_name = file_name
         self.index = index
+        self.key = (file_name, index)  # sort/identity key, refreshed whenever index changes
         self.content = content
         self.highlight = highlight
         self.highlight2 = None
+        self._indent = None  # leading whitespace of content, computed on first use
 
     def clone(self):
         cloned = Line(self.file_name, self.index, self.content, self.highlight)
@@ -55,7 +234,16 @@ class Line:
         return cloned
 
     def __eq__(self, other):
-        return self.file_name == other.file_name and self.index == other.index
+        if not isinstance(other, Line):
+            return NotImplemented
+        return self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    @property
+    def lang(self):
+        return _lang_for(self.file_name)
 
     def __str__(self) -> str:
         content = self.get_highlighted_content()
@@ -66,35 +254,31 @@ class Line:
            return f"{self.file_name}:{self.index + 1:<5}: {content}"
 
     def get_highlighted_content(self) -> str:
-        RED = "\033[0;31m"
-        BLUE = "\033[0;34m"
-        RESET = "\033[0m"
-
         content = self.content
         if self.highlight2:
-            content = re.sub(self.highlight2, f"{BLUE}\\g<0>{RESET}", content)
+            content = _highlighter(self.highlight2, BLUE)(content)
 
         if self.highlight:
-            content = re.sub(self.highlight, f"{RED}\\g<0>{RESET}", content)
+            content = _highlighter(self.highlight, RED)(content)
         
         return content
 
 
-    def get_indentation_pattern(self, suffix: str) -> str:
-        match = re.match(r"^(\s*)", self.content)
-        indentation = match.group(1) if match else ""
-        return "^" + re.escape(indentation) + suffix
-
-    def __getattr__(self, name):
-        return getattr(self.content, name)
-
+    def get_indentation_pattern(self, suffix: str) -> re.Pattern:
+        if self._indent is None:
+            self._indent = self.content[:len(self.content) - len(self.content.lstrip())]
+        return _indentation_pattern(self._indent, suffix)
 
     def __contains__(self, item):
         return item in self.content
 
 
-    def match(self, pattern:str) -> bool:
-        return re.search(pattern, self.content) is not None
+    def match(self, pattern: Matcher) -> bool:
+        if isinstance(pattern, re.Pattern):
+            return pattern.search(self.content) is not None
+        if callable(pattern):
+            return pattern(self.content)
+        return _compile(pattern).search(self.content) is not None
 
 
     def move_up(self) -> bool:
@@ -105,8 +289,10 @@ class Line:
         lines = Line.load_file(self.file_name)
 
         self.index -= 1
+        self.key = (self.file_name, self.index)
         self.highlight = None
-        self.content = lines[self.index].rstrip()
+        self.content = lines[self.index]
+        self._indent = None
         return True
         
 
@@ -118,8 +304,10 @@ class Line:
             return  False
 
         self.index += 1
+        self.key = (self.file_name, self.index)
         self.highlight = None
-        self.content = lines[self.index].rstrip()
+        self.content = lines[self.index]
+        self._indent = None
         return True
 
     def merge(self, other):
@@ -128,30 +316,97 @@ class Line:
         if other.highlight2:
             self.highlight2 = other.highlight2
 
-def get_match(pattern:str, place: str, extensions: list[str] = None) -> list[Line]:
+def _rg_text(field: dict) -> str:
+    # rg reports non utf-8 data base64 encoded under "bytes"
+    if "text" in field:
+        return field["text"]
+    return base64.b64decode(field["bytes"]).decode('utf-8', 'replace')
+
+def _rg_path(field: dict) -> str:
+    # Same as _rg_text, but decoded like grep's names so the file can be opened again
+    if "text" in field:
+        return field["text"]
+    return os.fsdecode(base64.b64decode(field["bytes"]))
+
+def _spawn(cmd: list[str]) -> subprocess.Popen:
+    """
+    Starts a search tool with its output on a pipe.
+    """
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=PIPE_BUFSIZE)
 
-    cmd = ["grep", "-ERHn", pattern, place]
+def _get_match_rg(pattern:str, place: str, extensions: list[str] = None) -> list[Line]:
+
+    # --hidden/--no-ignore/--follow keep the same file set as grep -R, which follows symlinks.
+    # --no-config so a user's RIPGREP_CONFIG_PATH can't change the output or the files searched.
+    cmd = [RG, "--no-config", "--json", "-n", "--hidden", "--no-ignore", "--follow", "-e", pattern, place]
+    if _is_literal(pattern):
+        cmd.insert(1, "--fixed-strings")
     if extensions:
         for ext in extensions:
-            cmd.insert(1, f"--include=*{ext}")
+            cmd.insert(1, f"--glob=*{ext}")
 
-    grep_result = subprocess.run(cmd, capture_output=True, text=True)
+    # json.loads takes the raw bytes, no text layer is needed on the pipe
+    proc = _spawn(cmd)
 
-    if grep_result.returncode != 0:
-        return None
+    res = []
+
+    for s in proc.stdout:
+
+        msg = json.loads(s)
+        if msg["type"] != "match":
+            continue
+
+        data = msg["data"]
+        file_name = _rg_path(data["path"])
+        content = _rg_text(data["lines"]).rstrip()
+
+        res.append(Line(file_name, data["line_number"] - 1, content, highlight=pattern))
+
+    proc.wait()
+
+    # rg prints files in the order its threads finish them, search_tree depends on a stable order.
+    # Sorting here keeps the parallel search, --sort=path would make rg single threaded.
+    res.sort(key=lambda l: l.key)
 
+    return res or None
+
+def get_match(pattern: Union[str, re.Pattern], place: str, extensions: list[str] = None) -> list[Line]:
+    """
+    A compiled pattern is handed to grep/rg as its source, it must be valid for grep -E.
+    """
+    if isinstance(pattern, re.Pattern):
+        pattern = pattern.pattern
+
+    if RG:
+        return _get_match_rg(pattern, place, extensions)
+
+    # -Z ends the file name with a NUL, so names containing ':' parse correctly.
+    # Literal patterns, the usual identifiers, take grep's faster fixed string search.
+    cmd = [GREP, "-FRHnZ" if _is_literal(pattern) else "-ERHnZ", pattern, place]
+    if extensions:
+        for ext in extensions:
+            cmd.insert(1, f"--include=*{ext}")
+
+    # Stream the output so Lines are built while grep is still scanning.
+    # It is parsed as bytes: only the content is decoded per line, file names once per file.
+    proc = _spawn(cmd)
 
     res = []
+    file_names = {}
 
-    for s in grep_result.stdout.splitlines():
+    for s in proc.stdout:
 
-        file_name, line_num, content = s.split(':', 2)
+        raw_name, _, rest = s.partition(b'\0')
+        line_num, _, content = rest.partition(b':')
 
-        file_name = file_name.strip()
-        line_num = int(line_num.strip())
-        content = content.rstrip()
+        file_name = file_names.get(raw_name)
+        if file_name is None:
+            file_name = file_names[raw_name] = os.fsdecode(raw_name)
 
-        res.append(Line(file_name, line_num - 1, content, highlight=pattern))
+        res.append(Line(file_name, int(line_num) - 1, content.decode('utf-8', 'replace').rstrip(), highlight=pattern))
+
+    if proc.wait() != 0:
+        return None
 
     return res
 
@@ -172,42 +427,32 @@ def merge_lines(lines1: list[Line], lines2: list[Line]):
         return
 
     result = []
-    i = 0
-    j = 0
-    while i < len(lines1) and j < len(lines2):
-        line1 = lines1[i]
-        line2 = lines2[j]
-        
-        key1 = (line1.file_name, line1.index)
-        key2 = (line2.file_name, line2.index)
-
-        if key1 < key2:
-            result.append(line1)
-            i += 1
-        elif key2 < key1:
-            result.append(line2)
-            j += 1
-        else:  # Keys are equal, merge
-            line1.merge(line2)
-            result.append(line1)
-            i += 1
-            j += 1
-
-    # Add remaining lines
-    if i < len(lines1):
-        result.extend(lines1[i:])
-    if j < len(lines2):
-        result.extend(lines2[j:])
+    last_key = None
+    # heapq.merge is stable, so on equal keys the line from lines1 comes first
+    for line in heapq.merge(lines1, lines2, key=lambda l: l.key):
+        if line.key == last_key:  # Keys are equal, merge
+            result[-1].merge(line)
+            continue
+        result.append(line)
+        last_key = line.key
 
     lines1[:] = result
 
 
 class Block:
+    """
+    Sorted lines of a single file, e.g. a definition or a function body.
+    """
+    __slots__ = ('lang', 'lines', 'start', 'end', '_file_name', '_indices', '_by_index')
 
     def __init__(self, lang, line: Line = None):
 
         self.lang = lang 
         self.lines = []
+        # All lines share one file, so plain int indexes are enough to order and find them
+        self._file_name = line.file_name if line else None
+        self._indices = []  # index of each line, kept parallel to self.lines
+        self._by_index = {}
         self.start = None
         self.end = None
 
@@ -220,109 +465,183 @@ class Block:
         """
         Adds a new Line object to the block, maintaining sorted order and handling duplicates.
         """
-        for existing_line in self.lines:
-            if existing_line == new_line:
-                existing_line.merge(new_line)
-                return
+        if self._file_name is None:
+            self._file_name = new_line.file_name
+        elif new_line.file_name != self._file_name:
+            raise ValueError(f"{new_line.file_name} added to a block of {self._file_name}")
+
+        index = new_line.index
+        # Fills moving down mostly add past the last line, no lookup or bisect needed then
+        if not self._indices or index > self._indices[-1]:
+            self._append_sorted_end(new_line)
+            return
+
+        existing = self._by_index.get(index)
+        if existing is not None:
+            existing.merge(new_line)
+            return
+
+        i = bisect.bisect_left(self._indices, index)
+        self._indices.insert(i, index)
+        self.lines.insert(i, new_line)
+        self._by_index[index] = new_line
+
+    def _append_sorted_end(self, line: Line):
+        """
+        Appends a line known to sort after every line of the block.
+        """
+        self._indices.append(line.index)
+        self.lines.append(line)
+        self._by_index[line.index] = line
+
+    def _prepend_sorted(self, lines: list[Line]):
+        """
+        Prepends sorted lines known to sort before every line of the block, in one slice insert.
+        """
+        self._indices[0:0] = [l.index for l in lines]
+        self.lines[0:0] = lines
+        self._by_index.update((l.index, l) for l in lines)
+
+    def _add_scanned(self, file_name: str, index: int, content: str, highlight2: str):
+        """
+        Adds a line reached by a scan, creating a Line only when it is not in the block yet.
+        """
+        existing = self._by_index.get(index)
+        if existing is not None:
+            if highlight2:
+                existing.highlight2 = highlight2
+            return
 
-        insertion_point = 0
-        for i, line in enumerate(self.lines):
-            if (line.file_name, line.index) < (new_line.file_name, new_line.index):
-                insertion_point = i + 1
+        line = Line(file_name, index, content)
+        line.highlight2 = highlight2
+        self.add(line)
+
+    def _continuous_end(self) -> int:
+        """
+        Position of the last line of the run of consecutive lines starting at self.lines[0].
+
+        Indexes are sorted and unique, so indices[i] == first + i holds for a prefix
+        of the block only, and the end of that prefix can be found by bisection.
+        """
+        first = self._indices[0]
+        lo, hi = 0, len(self._indices) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self._indices[mid] == first + mid:
+                lo = mid
             else:
-                break
+                hi = mid - 1
+        return lo
 
-        self.lines.insert(insertion_point, new_line)
+    def clear(self):
+        self.lines.clear()
+        self._indices.clear()
+        self._by_index.clear()
 
-    def fill_up_until(self, pattern: str, stop_pattern: str = None) -> bool:
+    def fill_up_until(self, pattern: Matcher, stop_pattern: Matcher = None) -> bool:
         if not self.lines:
             return False
 
-        cursor = self.lines[0].clone()
+        first = self.lines[0]
 
-        if stop_pattern and cursor.match(stop_pattern):
+        if stop_pattern and first.match(stop_pattern):
             return False
 
-        if cursor.match(pattern):
+        if first.match(pattern):
             return True 
 
-        lines_to_add = []
-        while cursor.move_up():
-            if stop_pattern and cursor.match(stop_pattern):
-                self.lines.clear()
+        file_name = first.file_name
+        lines = Line.load_file(file_name)
+        found = _searcher(pattern)
+        stop = _searcher(stop_pattern) if stop_pattern else None
+
+        # Only indexes are tracked while scanning, Lines are built once the start is found
+        for i in range(first.index - 1, -1, -1):
+            content = lines[i]
+            if stop and stop(content):
+                self.clear()
                 return False
 
-            lines_to_add.append(cursor.clone())
-            if cursor.match(pattern):
-                for line in reversed(lines_to_add):
-                    self.add(line)
+            if found(content):
+                lines_to_add = [Line(file_name, j, lines[j]) for j in range(i, first.index)]
+                for line in lines_to_add:
+                    line.highlight2 = first.highlight2
+                # All of them are above the first line, nothing can be a duplicate
+                self._prepend_sorted(lines_to_add)
                 self.start = self.lines[0]
                 return True
 
         return False
 
-    def fill_down_until(self, pattern: str, stop_pattern: str = None) -> bool:
+    def fill_down_until(self, pattern: Matcher, stop_pattern: Matcher = None) -> bool:
         if not self.lines:
             return False
 
         # Find the last continuous line from the start of the block
-        current_continuous_line = self.lines[0]
-        for i in range(1, len(self.lines)):
-            if (self.lines[i].file_name == current_continuous_line.file_name and
-                self.lines[i].index == current_continuous_line.index + 1):
-                current_continuous_line = self.lines[i]
-            else:
-                break
-        
-        cursor = current_continuous_line.clone()
+        current_continuous_line = self.lines[self._continuous_end()]
 
         # If current_continuous_line already matches the pattern, we're done
-        if cursor.match(pattern):
+        if current_continuous_line.match(pattern):
             return True
 
-        while cursor.move_down():
-            if stop_pattern and cursor.match(stop_pattern):
-                self.lines.clear()
+        # Scan the cached lines directly instead of moving a cursor line by line
+        file_name = current_continuous_line.file_name
+        highlight2 = current_continuous_line.highlight2
+        lines = Line.load_file(file_name)
+        found = _searcher(pattern)
+        stop = _searcher(stop_pattern) if stop_pattern else None
+
+        for i in range(current_continuous_line.index + 1, len(lines)):
+            content = lines[i]
+            if stop and stop(content):
+                self.clear()
                 return False
 
-            self.add(cursor.clone())
-            if cursor.match(pattern):
+            self._add_scanned(file_name, i, content, highlight2)
+            if found(content):
                 return True
 
         return False
 
-    def get_start_with(self, pattern: str, stop_pattern: str = None) -> bool:
+    def get_start_with(self, pattern: Matcher, stop_pattern: Matcher = None) -> bool:
         if not self.lines:
             return False
 
-        cursor = self.lines[0].clone()
+        first = self.lines[0]
 
-        if cursor.match(pattern):
-            self.start = self.lines[0]
+        if first.match(pattern):
+            self.start = first
             return True
 
-        while cursor.move_up():
-            if stop_pattern and cursor.match(stop_pattern):
-                self.lines.clear()
+        lines = Line.load_file(first.file_name)
+        found = _searcher(pattern)
+        stop = _searcher(stop_pattern) if stop_pattern else None
+
+        for i in range(first.index - 1, -1, -1):
+            content = lines[i]
+            if stop and stop(content):
+                self.clear()
                 return False
 
-            if cursor.match(pattern):
-                self.add(cursor)
+            if found(content):
+                self._add_scanned(first.file_name, i, content, first.highlight2)
                 self.start = self.lines[0]
                 return True
 
         return False
 
 
-    def get_end_with(self, pattern: str):
+    def get_end_with(self, pattern: Matcher):
         if not self.lines:
             return
 
-        cursor = self.lines[-1].clone()
+        last = self.lines[-1]
+        lines = Line.load_file(last.file_name)
+        found = _searcher(pattern)
 
-        while cursor.move_down():
-            if cursor.match(pattern):
-                self.add(cursor.clone())
+        for i in range(last.index + 1, len(lines)):
+            if found(lines[i]):
+                self._add_scanned(last.file_name, i, lines[i], last.highlight2)
                 self.end = self.lines[-1]
                 return
 
@@ -336,18 +655,43 @@ class Block:
         if self.start.file_name != self.end.file_name:
             return
 
-        cursor = self.start.clone()
+        file_name = self.start.file_name
+        lines = Line.load_file(file_name)
+        first = self.start.index + 1
+        last = min(self.end.index, len(lines))
+        if first >= last:
+            return
 
-        while cursor.index < self.end.index - 1:
-            if not cursor.move_down():
-                break
-            self.add(cursor.clone())
+        # Rebuild the sorted slice covering the range in one pass instead of one insert per line
+        lo = bisect.bisect_left(self._indices, first)
+        hi = bisect.bisect_left(self._indices, last)
+
+        # Same highlighting as a scan from the start line, like _add_scanned
+        highlight2 = self.start.highlight2
+        new_lines = []
+        for i in range(first, last):
+            line = self._by_index.get(i)
+            if line is None:
+                line = self._by_index[i] = Line(file_name, i, lines[i])
+                line.highlight2 = highlight2
+            elif highlight2:
+                line.highlight2 = highlight2
+            new_lines.append(line)
+
+        self._indices[lo:hi] = range(first, last)
+        self.lines[lo:hi] = new_lines
 
     def __str__(self):
         return "\n".join(str(l) for l in self.lines)
 
-    def __getattr__(self, name):
-        return getattr(self.lines, name)
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __getitem__(self, index):
+        return self.lines[index]
 
     def __add__(self, other):
         if not isinstance(other, Block):
@@ -363,26 +707,27 @@ class Block:
 
 
 class Result:
+    __slots__ = ('lines', '_keys', '_by_key')
+
     def __init__(self):
         self.lines = []
+        self._keys = []  # (file_name, index) of each line, kept parallel to self.lines
+        self._by_key = {}
 
     def add(self, new_line: Line):
         """
         Adds a new Line object to the result, maintaining sorted order and handling duplicates.
         """
-        for existing_line in self.lines:
-            if existing_line == new_line:
-                existing_line.merge(new_line)
-                return
-
-        insertion_point = 0
-        for i, line in enumerate(self.lines):
-            if (line.file_name, line.index) < (new_line.file_name, new_line.index):
-                insertion_point = i + 1
-            else:
-                break
+        key = new_line.key
+        existing = self._by_key.get(key)
+        if existing is not None:
+            existing.merge(new_line)
+            return
 
-        self.lines.insert(insertion_point, new_line)
+        i = bisect.bisect_left(self._keys, key)
+        self._keys.insert(i, key)
+        self.lines.insert(i, new_line)
+        self._by_key[key] = new_line
 
     def add_block(self, block: Block):
         if not block:
@@ -390,15 +735,37 @@ class Result:
         for line in block.lines:
             self.add(line)
 
+    def add_list(self, new_lines: list[Line]):
+        """
+        Adds many lines at once: one sort, then a linear pass merging duplicates.
+        """
+        # The sort is stable, lines already in the result stay first among equal keys
+        lines = []
+        for line in sorted(itertools.chain(self.lines, new_lines), key=lambda l: l.key):
+            if lines and lines[-1].key == line.key:
+                lines[-1].merge(line)
+            else:
+                lines.append(line)
+
+        self.lines = lines
+        self._keys = [l.key for l in lines]
+        self._by_key = dict(zip(self._keys, lines))
+
     def show(self):
-        for line in self.lines:
-            print(line)
+        # One write for the whole result instead of a print per line
+        if self.lines:
+            sys.stdout.write("\n".join(map(str, self.lines)) + "\n")
 
 result = Result()
 
 
 EXTENSIONS = {}
 
+@functools.lru_cache(maxsize=8192)
+def _lang_for(filename: str):
+    _, ext = os.path.splitext(filename)
+    return EXTENSIONS.get(ext)
+
 class Language (ABC):
     extensions: list[str] = []
 
@@ -416,6 +783,7 @@ class Language (ABC):
 
     @classmethod
     def register(cls):
+        _lang_for.cache_clear()
         instance = cls()
         name = cls.__name__.lower()
         globals()[name] = instance  # create global variables (cpp, python,...)
@@ -430,8 +798,7 @@ class Language (ABC):
 
     @classmethod
     def get_by_filename(cls, filename: str):
-        _, ext = os.path.splitext(filename)
-        return EXTENSIONS.get(ext)
+        return _lang_for(filename)
 
 
 ########## Each language in a class ##############################
@@ -454,33 +821,85 @@ class Cpp (Language):
         "union", "unsigned", "using", "virtual", "void", "volatile", "wchar_t", "while",
         "xor", "xor_eq"
     }
-
+    AGGREGATE_KEYWORDS = ("typedef", "struct", "enum", "union")
+
+    FUNCTION_START_RE = re.compile(r"^(?!.*\)\s*;)(?!\s*(?:if|else|for|while|switch|catch|return)\b)(?:\s*[A-Za-z_][\w\s\*\(\):<>]*\s+(?:\w+::)*\w+\s*\(|(?:\w+::)*\w+\s*\()")
+    FUNCTION_NAME_RE = re.compile(r"(\b\w+(?:::\w+)*)\s*$")
+    FIELD_STRUCT_UNION_RE = re.compile(r"^\s*(\w+\s+)?\w+\s+\w+\s*;$")
+    NESTED_STATEMENT_RE = re.compile(r"^\s*(if|else|for|while|do|switch|try|catch)\b")
+    SWITCH_RE = re.compile(r"^\s*switch")
+    CASE_LABEL_RE = re.compile(r"^\s*(case .*|default)\s*:")
+    BARE_FUNCTION_NAME_RE = re.compile(r"^\w+\s*\(")
+    AGGREGATE_KEYWORD_RE = re.compile(r"(struct|enum|union|typedef)")
+    ENUM_KEYWORD_RE = re.compile(r"\benum\b")
+    SCOPE_END_RE = re.compile(r"(}|;)")
+    STRUCT_UNION_START_RE = re.compile(r"\b(struct|union)\b.*[^;]$")
+
+    # Fixed-string tests that don't need the regex engine
+    @staticmethod
+    def _is_not_continued(content: str) -> bool:
+        return content != "" and not content.endswith("\\")
+
+    @staticmethod
+    def _has_close_paren(content: str) -> bool:
+        return ")" in content
+
+    @staticmethod
+    def _has_declaration_end(content: str) -> bool:
+        return ");" in content
+
+    @staticmethod
+    def _has_open_brace(content: str) -> bool:
+        return "{" in content
+
+    @staticmethod
+    def _has_close_brace(content: str) -> bool:
+        return "}" in content
+
+    @staticmethod
+    def _has_semicolon(content: str) -> bool:
+        return ";" in content
+
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _define_patterns(pattern: str) -> tuple[tuple[tuple[str, ...], re.Pattern, str], ...]:
+        """
+        Compiles the get_define patterns for a user pattern once, in the order they are tried, each with its handler.
+        They stay separate searches: a user pattern with a top-level | isn't anchored by ^, so in a single
+        alternation a later branch could win over an earlier one.
+        Each pattern comes with the literals it can't match without, one of them must be in the line.
+        With a | in the user pattern a branch can match without them, then nothing is required.
+        """
+        anchored = "|" not in pattern
+        return tuple((required if anchored else (), re.compile(regex), handler) for required, regex, handler in (
+            # #define, with pattern in the name
+            (("#define",), r"^\s*#define\s+" + pattern + r"\b", '_get_define_macro'),
+            # function, with pattern in the name
+            # The name part is complex, allowing for namespaces: (\w*::)*\w*PATTERN\w*
+            # The leading lookahead is a linear pre-check: without PATTERN on the line the
+            # ambiguous prefix would backtrack polynomially over long runs of whitespace
+            (("(",), r"^(?=.*?" + pattern + r"\s*\()(?!.*\)\s*;)\s*[A-Za-z_][\w\s\*\(\):<>]*\s+(\w*::)*\**\s*" + pattern + r"\s*\(", '_get_define_function'),
+            (("(",), r"^(?!.*\)\s*;)" + pattern + r"\s*\(", '_get_define_function'),
+            # struct/enum/union, with pattern in the name
+            (Cpp.AGGREGATE_KEYWORDS, r"^\s*(typedef|struct|enum|union)\s+\b\w*" + pattern + r"\w*\b", '_get_define_struct_enum_union'),
+            # typedef struct {} name; with pattern in the name
+            (("}",), r"^\s*}\s*\b\w*" + pattern + r"\w*\b\s*;", '_get_define_struct_enum_union'),
+            # enum field
+            ((), r"^\s*" + pattern + r"\s*(=\s*[^,}]+)?\s*,?$", '_get_define_field_enum'),
+            # struct/union field
+            ((";",), Cpp.FIELD_STRUCT_UNION_RE.pattern, '_get_define_field_struct_union'),
+        ))
 
     def get_define(self, line: Line, pattern: str) -> Block:
 
-        # #define, with pattern in the name
-        if line.match(r"^\s*#define\s+" + pattern + r"\b"):
-            return self._get_define_macro(line)
-
-        # function, with pattern in the name
-        # The name part is complex, allowing for namespaces: (\w*::)*\w*PATTERN\w*
-        if line.match(r"^(?!.*\)\s*;)\s*[A-Za-z_][\w\s\*\(\):<>]*\s+(\w*::)*\**\s*" + pattern + r"\s*\(") or line.match(r"^(?!.*\)\s*;)" + pattern + r"\s*\("):
-            return self._get_define_function(line)
-
-        # struct/enum/union, with pattern in the name
-        if line.match(r"^\s*(typedef|struct|enum|union)\s+\b\w*" + pattern + r"\w*\b"):
-            return self._get_define_struct_enum_union(line)
-
-        # typedef struct {} name; with pattern in the name
-        if line.match(r"^\s*}\s*\b\w*" + pattern + r"\w*\b\s*;"):
-            return self._get_define_struct_enum_union(line)
-
-        if line.match(r"^\s*" + pattern + r"\s*(=\s*[^,}]+)?\s*,?$"):
-            return self._get_define_field_enum(line)
+        content = line.content
+        for required, regex, handler in self._define_patterns(pattern):
+            if required and not any(r in content for r in required):
+                continue
+            if regex.search(content):
+                return getattr(self, handler)(line)
 
-        if line.match(r"^\s*(\w+\s+)?\w+\s+\w+\s*;$"):
-            return self._get_define_field_struct_union(line)
-        
         return None
 
     def extract_function_name(self, line: Line) -> str:
@@ -491,7 +910,7 @@ class Cpp (Language):
         
         before_paren = content[:last_paren_index]
         
-        match = re.search(r"(\b\w+(?:::\w+)*)\s*$", before_paren.strip())
+        match = self.FUNCTION_NAME_RE.search(before_paren.strip())
         if match:
             return match.group(1).split("::")[-1]
 
@@ -513,34 +932,47 @@ class Cpp (Language):
         if not open_brace_line:
             return blk
 
+        # Scan the cached lines by index, Line objects are only built for the brace lines kept
+        lines = Line.load_file(line.file_name)
+
+        def line_at(i: int) -> Line:
+            found = Line(line.file_name, i, lines[i])
+            found.highlight2 = line.highlight2
+            return found
+
         brace_count = 0
-        cursor = line.clone()
         open_brace_list = []
-        while cursor.move_up() and cursor != open_brace_line:
-            brace_count += cursor.count("{") - cursor.count("}")           
+        for i in range(line.index - 1, -1, -1):
+            if i == open_brace_line.index:
+                break
+            content = lines[i]
+            brace_count += content.count("{") - content.count("}")           
             if brace_count > 0:
-                open_brace_list.append(cursor.clone())
+                open_brace_list.append(line_at(i))
                 brace_count = 0 # Reset brace_count after finding a wrapper
 
         brace_count = 0
-        cursor = line.clone()
+        end_index = blk.end.index if blk.end else None
         close_brace_list = [] # This logic is commented out as its purpose in nested wrappers needs re-evaluation
-        while cursor.move_down() and cursor != blk.end:
-            brace_count += cursor.count("}") - cursor.count("{") 
+        for i in range(line.index + 1, len(lines)):
+            if i == end_index:
+                break
+            content = lines[i]
+            brace_count += content.count("}") - content.count("{") 
             if brace_count > 0:
-                close_brace_list.insert(0, cursor.clone()) # Insert at beginning to maintain order relative to original file position
+                close_brace_list.insert(0, line_at(i)) # Insert at beginning to maintain order relative to original file position
                 brace_count = 0 # Reset brace_count after finding a wrapper
 
 
         for brace_line in open_brace_list:
             sub_blk = Block(self, brace_line) # Corrected: pass self.lang
-            if not sub_blk.fill_up_until(r"^\s*(if|else|for|while|do|switch|try|catch)\b"): # Refined regex and removed stop pattern
+            if not sub_blk.fill_up_until(self.NESTED_STATEMENT_RE): # Refined regex and removed stop pattern
                 continue
             debug (f"Found sub lock: {sub_blk.start} for line {line}")
-            if sub_blk.start.match(r"^\s*switch"):
+            if sub_blk.start.match(self.SWITCH_RE):
                 debug("Sub lock start with switch")
                 case_blk = Block(self, line)
-                case_blk.get_start_with(r"^\s*(case .*|default)\s*:")
+                case_blk.get_start_with(self.CASE_LABEL_RE)
                 blk += case_blk
 
             blk += sub_blk
@@ -554,19 +986,19 @@ class Cpp (Language):
 
     def _get_define_macro(self, line: Line) -> Block:
         blk = Block(Cpp, line)
-        blk.fill_down_until(r"[^\\]$")
+        blk.fill_down_until(self._is_not_continued)
         return blk
 
     def _get_define_function(self, line: Line) -> Block:
         blk = Block(Cpp, line)
-        if not ")" in blk.start and not blk.fill_down_until(r"\)", r"\);"):
+        if not ")" in blk.start and not blk.fill_down_until(self._has_close_paren, self._has_declaration_end):
             return None
 
         end_brace_pattern = blk.start.get_indentation_pattern(r"}.*")
 
         blk.fill_down_until(end_brace_pattern)
 
-        if blk.start.match(r"^\w+\s*\("):
+        if blk.start.match(self.BARE_FUNCTION_NAME_RE):
             return_type_line = blk.start.clone()
             return_type_line.move_up()
             blk.add(return_type_line)
@@ -575,7 +1007,7 @@ class Cpp (Language):
 
     def _get_define_struct_enum_union(self, line: Line) -> Block:
         blk = Block(cpp, line)
-        if blk.start.match(r"(struct|enum|union|typedef)"):
+        if blk.start.match(self.AGGREGATE_KEYWORD_RE):
             blk.fill_down_until(blk.start.get_indentation_pattern(r"}.*"))
         else:
             blk.fill_up_until(blk.start.get_indentation_pattern(r"(struct|enum|union|typedef)"))
@@ -586,7 +1018,7 @@ class Cpp (Language):
 
         blk = Block(cpp, line)
 
-        if not blk.fill_up_until(r"\benum\b", r"(}|;)" ):
+        if not blk.fill_up_until(self.ENUM_KEYWORD_RE, self.SCOPE_END_RE):
             return None
 
         end_brace_pattern = blk.start.get_indentation_pattern(r"}.*")
@@ -598,7 +1030,7 @@ class Cpp (Language):
 
         blk = Block(cpp, line)
 
-        if not blk.get_start_with(r"\b(struct|union)\b.*[^;]$", r"}" ):
+        if not blk.get_start_with(self.STRUCT_UNION_START_RE, self._has_close_brace):
             return None
 
         end_brace_pattern = blk.start.get_indentation_pattern(r"}.*")
@@ -608,21 +1040,18 @@ class Cpp (Language):
 
     def get_function_wrapper(self, line: Line) -> Block:
 
-        #function_start_pattern = r"^(?!.*\)\s*;)\s*[A-Za-z_][\w\s\*\(\)]*\s+(\w*::)*\w+\s*\("
-        function_start_pattern = r"^(?!.*\)\s*;)(?!\s*(?:if|else|for|while|switch|catch|return)\b)(?:\s*[A-Za-z_][\w\s\*\(\):<>]*\s+(?:\w+::)*\w+\s*\(|(?:\w+::)*\w+\s*\()"
-        
         # If the line itself is a function definition, it can't have a wrapper in this context.
-        if line.match(function_start_pattern):
+        if "(" in line.content and line.match(self.FUNCTION_START_RE):
             return None
 
         blk = Block(cpp, line) 
 
-        if not blk.get_start_with(function_start_pattern):
+        if not blk.get_start_with(self.FUNCTION_START_RE):
             return None
 
         # blk.start is now the function signature line.
         # Now fill down to get the full signature until the opening brace.
-        if not blk.fill_down_until(r"{", stop_pattern=r";"):
+        if not blk.fill_down_until(self._has_open_brace, stop_pattern=self._has_semicolon):
             # This is likely a function declaration, not a definition.
             return None
 
@@ -642,10 +1071,23 @@ Language.register_all()
 def search_grep(pattern:str, path:str):
     lines = get_match(pattern, path)
     if lines:
-        for line in lines:
-            result.add(line)
+        result.add_list(lines)
         result.show()
 
+def _compute_defines(file_hits: tuple) -> list[Line]:
+    """
+    Worker for search_def: rebuilds the matched Lines of one file from plain values so it can run in a process pool.
+    """
+    file_name, pattern, hits = file_hits
+
+    res = []
+    for index, content, highlight in hits:
+        line = Line(file_name, index, content, highlight)
+        block = line.lang.get_define(line, pattern)
+        if block:
+            res.extend(block.lines)
+    return res
+
 def search_def(pattern:str):
 
     lines = get_match(pattern, "./")
@@ -653,15 +1095,24 @@ def search_def(pattern:str):
     if not lines:
         return
 
+    # One task per file, so each worker reads a file once and its line cache stays warm
+    hits_by_file = {}
     for l in lines:
-        lang = Language.get_by_filename(l.file_name)
-
-        if not lang:
-            continue
+        if l.lang:
+            hits_by_file.setdefault(l.file_name, []).append((l.index, l.content, l.highlight))
+    groups = [(file_name, pattern, hits) for file_name, hits in hits_by_file.items()]
+
+    if (
+        len(groups) < 2
+        or (os.cpu_count() or 1) < 2
+        or sum(len(hits) for _, _, hits in groups) < PARALLEL_MIN_HITS
+    ):
+        blocks = map(_compute_defines, groups)
+    else:
+        with ProcessPoolExecutor() as ex:
+            blocks = list(ex.map(_compute_defines, groups))
 
-        res = lang.get_define(l, pattern)
-        if res:
-            result.add_block(res)
+    result.add_list(itertools.chain.from_iterable(blocks))
     result.show()
       
 def search_wrapper(pattern:str):
@@ -671,15 +1122,18 @@ def search_wrapper(pattern:str):
     if not lines:
         return
 
+    blocks = []
     for l in lines:
-        lang = Language.get_by_filename(l.file_name)
+        lang = l.lang
 
         if not lang:
             continue
 
         res = lang.get_function_wrapper(l)
         if res:
-            result.add_block(res)
+            blocks.append(res.lines)
+
+    result.add_list(itertools.chain.from_iterable(blocks))
     result.show()
 
 def search_nested_wrapper(pattern:str):
@@ -689,49 +1143,62 @@ def search_nested_wrapper(pattern:str):
     if not lines:
         return
 
+    blocks = []
     for l in lines:
-        lang = Language.get_by_filename(l.file_name)
+        lang = l.lang
 
         if not lang:
             continue
 
         res = lang.get_nested_wrapper(l)
         if res:
-            result.add_block(res)
+            blocks.append(res.lines)
 
+    result.add_list(itertools.chain.from_iterable(blocks))
     result.show()
 
-def get_caller_blocks(pattern: str, search_path: str, extensions: list[str] = None) -> list[tuple[Block, Line]]:
-    debug(f"get_caller_blocks: Searching for pattern '{pattern}' in '{search_path}' with extensions: {extensions}")
-    lines = get_match(pattern, search_path, extensions)
+def _get_function_wrapper(line: Line) -> Block:
+    lang = line.lang
+    return lang.get_function_wrapper(line) if lang else None
+
+def caller_blocks_of(lines: list[Line], pattern: Union[str, re.Pattern]) -> list[tuple[Block, Line]]:
+    """
+    Wrapper blocks of the lines where pattern was found, one per distinct wrapper.
+    """
     if not lines:
-        debug(f"get_caller_blocks: No matches found for '{pattern}'")
+        debug(f"caller_blocks_of: No matches found for '{pattern}'")
         return []
 
     caller_info_list = []
-    seen_block_ids = set() # To store IDs of wrapper blocks already added
+    seen_block_starts = set() # Start lines of wrapper blocks already added
 
-    for line in lines: # `line` here is the Line object where `pattern` was found
-        lang = Language.get_by_filename(line.file_name)
-        if not lang:
-            debug(f"get_caller_blocks: No language found for file '{line.file_name}'")
+    # Threads overlap the file reads of many hits, map keeps the results in the order of lines.
+    # The wrapper search itself is regex work holding the GIL, so with one CPU it stays on this thread.
+    if len(lines) >= PARALLEL_MIN_HITS and (os.cpu_count() or 1) > 1:
+        with ThreadPoolExecutor(max_workers=min(16, (os.cpu_count() or 1) * 2)) as ex:
+            wrapper_blocks = list(ex.map(_get_function_wrapper, lines))
+    else:
+        wrapper_blocks = map(_get_function_wrapper, lines)
+
+    for line, wrapper_block in zip(lines, wrapper_blocks): # `line` here is the Line object where `pattern` was found
+        if not line.lang:
+            debug(f"caller_blocks_of: No language found for file '{line.file_name}'")
             continue
 
-        wrapper_block = lang.get_function_wrapper(line)
         if not wrapper_block or not wrapper_block.start:
-            debug(f"get_caller_blocks: No wrapper block found for line '{line.content.strip()}' (where pattern was found)")
+            debug(f"caller_blocks_of: No wrapper block found for line '{line.content.strip()}' (where pattern was found)")
             continue
             
         block_id = f"{wrapper_block.start.file_name}:{wrapper_block.start.index}"
-        if block_id not in seen_block_ids:
+        if wrapper_block.start not in seen_block_starts:
             caller_info_list.append((wrapper_block, line)) # Store both the wrapper block and the call line
-            seen_block_ids.add(block_id)
-            debug(f"get_caller_blocks: Found caller block '{block_id}' for '{pattern}' (content: {wrapper_block.start.content.strip()}), called from {line.file_name}:{line.index + 1}")
+            seen_block_starts.add(wrapper_block.start)
+            debug(f"caller_blocks_of: Found caller block '{block_id}' for '{pattern}' (content: {wrapper_block.start.content.strip()}), called from {line.file_name}:{line.index + 1}")
             
-    debug(f"get_caller_blocks: Returning {len(caller_info_list)} caller blocks for '{pattern}'")
+    debug(f"caller_blocks_of: Returning {len(caller_info_list)} caller blocks for '{pattern}'")
     return caller_info_list
 
-def print_top_down_tree(caller_id: str, callees_of: dict, nodes: dict, visited_ids: set, prefix: str):
+def print_top_down_tree(caller_id: str, callees_of: dict, nodes: dict, name_to_ids: dict, visited_ids: set, prefix: str):
     if caller_id in visited_ids:
         return
     visited_ids.add(caller_id)
@@ -747,11 +1214,8 @@ def print_top_down_tree(caller_id: str, callees_of: dict, nodes: dict, visited_i
         callee_name = callee_info['name']
         call_line = callee_info['line']
         
-        callee_id = None
-        for n_id, n_info in nodes.items():
-            if n_info['name'] == callee_name:
-                callee_id = n_id
-                break
+        callee_ids = name_to_ids.get(callee_name)
+        callee_id = callee_ids[0] if callee_ids else None
 
         if callee_id and callee_id in nodes:
             print(f"{prefix}{connector}{nodes[callee_id]['line'].get_highlighted_content().strip()} ({nodes[callee_id]['line'].file_name}:{nodes[callee_id]['line'].index+1})")
@@ -765,8 +1229,67 @@ def print_top_down_tree(caller_id: str, callees_of: dict, nodes: dict, visited_i
         
         if callee_id:
             new_prefix = prefix + ("    " if is_last else "│   ")
-            print_top_down_tree(callee_id, callees_of, nodes, visited_ids, new_prefix)
+            print_top_down_tree(callee_id, callees_of, nodes, name_to_ids, visited_ids, new_prefix)
+
+
+@functools.lru_cache(maxsize=1024)
+def _call_pattern(name: str) -> re.Pattern:
+    # re.escape keeps identifiers as they are, so the source stays a valid grep -E pattern
+    return re.compile(r"\b" + re.escape(name) + r"\b.*\(")
+
+def _pattern_batches(names: list[str]):
+    """
+    Splits names so each alternation of their call patterns stays below COMBINED_PATTERN_MAX_LEN.
+    """
+    batch = []
+    length = 0
+    for name in names:
+        size = len(_call_pattern(name).pattern) + 1
+        if batch and length + size > COMBINED_PATTERN_MAX_LEN:
+            yield batch
+            batch = []
+            length = 0
+        batch.append(name)
+        length += size
+    if batch:
+        yield batch
+
+def match_level(batch: list[tuple], search_path: str) -> dict:
+    """
+    Finds the call lines for every callee of one search_tree level.
+
+    Callees sharing the same extensions are searched at once with an
+    alternation of their patterns, then each hit is given to every callee
+    whose own pattern matches it. This runs one search per level and
+    extension set instead of one per callee.
+
+    Results are keyed by (name, extensions), a name may be queued once per
+    extension set in the same level.
+    """
+    groups = {}
+    for name, level, extensions in batch:
+        groups.setdefault(tuple(extensions) if extensions else None, []).append((name, level))
+
+    matches = {}
+    for key, entries in groups.items():
+        extensions = list(key) if key else None
+
+        if len(entries) == 1:
+            name, level = entries[0]
+            search_p = name if level == 0 else _call_pattern(name)
+            matches[(name, key)] = get_match(search_p, search_path, extensions)
+            continue
+
+        # Only levels > 0 batch several callees, the user pattern is alone at level 0
+        for names in _pattern_batches([name for name, _ in entries]):
+            combined = re.compile("|".join(_call_pattern(name).pattern for name in names))
+            debug(f"match_level: Searching {len(names)} callees at once with '{combined.pattern}'")
+            lines = get_match(combined, search_path, extensions) or []
+            for name in names:
+                search_p = _call_pattern(name)
+                matches[(name, key)] = [l for l in lines if search_p.search(l.content)]
 
+    return matches
 
 def search_tree(pattern: str, max_level: int = 10):
     debug(f"search_tree: Starting for pattern '{pattern}' with max level {max_level}")
@@ -775,45 +1298,65 @@ def search_tree(pattern: str, max_level: int = 10):
     nodes = {}
     callers_of = {}
 
-    queue = [(pattern, 0, None)] # (pattern, level, extensions)
-    processed_patterns = {pattern}
+    queue = deque([(pattern, 0, None)]) # (pattern, level, extensions)
+    # name -> frozenset of the extensions already searched for it, None when every file was
+    processed_patterns = {pattern: None}
 
     while queue:
-        current_pattern, level, current_extensions = queue.pop(0)
+        # Take the whole level at once, the queue holds levels in increasing order
+        level = queue[0][1]
+        batch = []
+        while queue and queue[0][1] == level:
+            batch.append(queue.popleft())
 
         if level >= max_level:
             continue
 
-        search_p = current_pattern if level == 0 else r"\b" + re.escape(current_pattern) + r"\b.*\("
-        
-        caller_info_list = get_caller_blocks(search_p, search_path, extensions=current_extensions)
-        
-        if not caller_info_list:
-            continue
+        matches = match_level(batch, search_path)
 
-        if current_pattern not in callers_of:
-            callers_of[current_pattern] = []
+        for current_pattern, level, current_extensions in batch:
+            search_p = current_pattern if level == 0 else _call_pattern(current_pattern)
+            debug(f"search_tree: Processing '{search_p}' at level {level} with extensions: {current_extensions}")
 
-        for wrapper_block, call_line in caller_info_list:
-            if level > 0:
-                call_line.highlight = None
+            key = tuple(current_extensions) if current_extensions else None
+            caller_info_list = caller_blocks_of(matches.get((current_pattern, key)), search_p)
 
-            caller_name = wrapper_block.lang.extract_function_name(wrapper_block.start)
-            if not caller_name or caller_name in wrapper_block.lang.keywords:
+            if not caller_info_list:
                 continue
-            
-            wrapper_block.start.highlight2 = r"\b" + caller_name + r"\b"
-            caller_id = f"{wrapper_block.start.file_name}:{wrapper_block.start.index}"
-            debug(f"caller_id = {caller_id}")
 
-            if caller_id not in nodes:
-                nodes[caller_id] = {'name': caller_name, 'lang': wrapper_block.lang, 'line': wrapper_block.start}
+            if current_pattern not in callers_of:
+                callers_of[current_pattern] = []
+
+            for wrapper_block, call_line in caller_info_list:
+                if level > 0:
+                    call_line.highlight = None
+
+                caller_name = wrapper_block.lang.extract_function_name(wrapper_block.start)
+                if not caller_name or caller_name in wrapper_block.lang.keywords:
+                    continue
             
-            callers_of[current_pattern].append((caller_id, call_line))
+                wrapper_block.start.highlight2 = r"\b" + caller_name + r"\b"
+                caller_id = f"{wrapper_block.start.file_name}:{wrapper_block.start.index}"
+                debug(f"caller_id = {caller_id}")
 
-            if caller_name not in processed_patterns:
-                processed_patterns.add(caller_name)
-                queue.append((caller_name, level + 1, wrapper_block.lang.extensions))
+                if caller_id not in nodes:
+                    nodes[caller_id] = {'name': caller_name, 'lang': wrapper_block.lang, 'line': wrapper_block.start}
+            
+                callers_of[current_pattern].append((caller_id, call_line))
+
+                # Search again only for extensions not covered yet, e.g. the same name in another language
+                explored = processed_patterns.get(caller_name, frozenset())
+                if explored is None:
+                    continue
+                new_extensions = [ext for ext in wrapper_block.lang.extensions if ext not in explored]
+                if new_extensions:
+                    processed_patterns[caller_name] = explored | frozenset(new_extensions)
+                    queue.append((caller_name, level + 1, new_extensions))
+
+    # Reverse index so callers can be found by name without scanning nodes
+    name_to_ids = {}
+    for node_id, node_info in nodes.items():
+        name_to_ids.setdefault(node_info['name'], []).append(node_id)
 
     # --- Invert graph for printing ---
     callees_of = {node_id: [] for node_id in nodes}
@@ -826,13 +1369,9 @@ def search_tree(pattern: str, max_level: int = 10):
 
     # --- Find roots ---
     all_caller_ids = set(nodes.keys())
-    callee_ids_of_callers = set()
-    for name in all_callee_names:
-        for node_id, node_info in nodes.items():
-            if node_info['name'] == name:
-                # This node is a callee of another node in the graph
-                if name != pattern: # The original pattern can also be a root
-                    callee_ids_of_callers.add(node_id)
+    # These nodes are callees of another node in the graph, the original pattern can also be a root
+    callee_ids_of_callers = set(itertools.chain.from_iterable(
+        name_to_ids.get(name, []) for name in all_callee_names if name != pattern))
     
     root_ids = all_caller_ids - callee_ids_of_callers
 
@@ -849,7 +1388,7 @@ def search_tree(pattern: str, max_level: int = 10):
     for root_id in root_ids:
         line = nodes[root_id]['line']
         print(f"{line.get_highlighted_content().strip()} ({line.file_name}:{line.index+1})")
-        print_top_down_tree(root_id, callees_of, nodes, set(), "")
+        print_top_down_tree(root_id, callees_of, nodes, name_to_ids, set(), "")
         print("-" * 20)
 
 def search_var(pattern: str):
@@ -864,7 +1403,7 @@ def search_var(pattern: str):
 
     found_global = False
     for line in all_occurrences:
-        lang = Language.get_by_filename(line.file_name)
+        lang = line.lang
         if not lang:
             continue
 